@@ -12,16 +12,12 @@ from homeassistant.const import (
 )
 from homeassistant.core import HomeAssistant, callback
 
-from pytele2api.const import (
-    CONF_SUBSCRIPTION,
-    CONF_SUBSCRIPTIONMODEL,
-)
-
 from .const import (
     DOMAIN,
     POLL_INTERVAL,
+    CONF_SUBSCRIPTION,
+    CONF_SUBSCRIPTIONMODEL,
 )
-from . import Tele2Manager
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -31,6 +27,8 @@ async def validate_input(hass: HomeAssistant, data: dict) -> dict:
 
     Data has the keys from DATA_SCHEMA with values provided by the user.
     """
+    from .manager import Tele2Manager
+
     _LOGGER.debug("Getting subId")
     hub = Tele2Manager(hass, data)
     # The dummy hub provides a `test_connection` method to ensure it's working
@@ -5,9 +5,26 @@ DEFAULT_NAME = "Tele2 Data usage"
 DEVICE_NAME = "Tele2"
 ATTRIBUTE_UNLIMITED = "Unlimited"
 POLL_INTERVAL = "poll_interval"
+STARTUP_PROFILE = DOMAIN + "_startup_profile"
+CONF_FLEET = "fleet"
+CONF_SUBSCRIPTIONS = "subscriptions"
+FLEET_WORKERS = "fleet_workers"
+
+# Mirrors pytele2api.const, importing that module loads the whole api
+# (and requests) which we only want once data is actually fetched.
+CONF_SUBSCRIPTION = "subscriptionId"
+CONF_SUBSCRIPTIONMODEL = "subscriptionModel"
+
+RES_LIMIT = "packageLimit"
+RES_USAGE = "usage"
+RES_UNLIMITED = "hasUnlimitedData"
+RES_DATA_LEFT = "dataLeft"
+RES_PERIOD_START = "periodStart"
+RES_PERIOD_END = "periodEnd"
+RES_ERROR = "error"
 
 
 class SensorType(Enum):
     DATA = 1
     DATE = 2
-    OTHER = 3
\ No newline at end of file
+    OTHER = 3
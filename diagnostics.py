@@ -0,0 +1,15 @@
+"""Diagnostics support for Tele2."""
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import STARTUP_PROFILE
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict:
+    """Return the startup profile for a config entry."""
+    profile = hass.data.get(STARTUP_PROFILE, {}).get(entry.entry_id)
+    if profile is None:
+        return {}
+    return {"startup_profile": profile.asDict()}
@@ -0,0 +1,385 @@
+"""Fleet mode: many subscriptions refreshed by a bounded pool of workers."""
+import asyncio
+import datetime
+import functools
+import logging
+import math
+import time
+
+from homeassistant.const import (
+    CONF_NAME,
+    CONF_USERNAME,
+    CONF_PASSWORD,
+)
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_interval
+
+from .const import (
+    CONF_FLEET,
+    CONF_SUBSCRIPTIONS,
+    FLEET_WORKERS,
+    POLL_INTERVAL,
+    CONF_SUBSCRIPTION,
+    CONF_SUBSCRIPTIONMODEL,
+    RES_UNLIMITED,
+    RES_LIMIT,
+    RES_USAGE,
+    RES_DATA_LEFT,
+    RES_PERIOD_START,
+    RES_PERIOD_END,
+    RES_ERROR,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Upper bound (in cycles) for how long a failing account is left alone.
+MAX_BACKOFF_CYCLES = 16
+# Seconds before a single HTTP request to Tele2 is given up on.
+REQUEST_TIMEOUT = 30
+# Seconds a whole line fetch (login retry included) may take.
+FETCH_TIMEOUT = 90
+
+
+class FleetLine:
+    """One subscription in the fleet.
+
+    Exposes `config` and `_data` like Tele2Manager so the regular sensors
+    can be reused for it.
+    """
+
+    def __init__(self, name: str, username: str, password: str, subscriptionId):
+        self.config = {
+            CONF_NAME: name + " " + subscriptionId,
+            CONF_USERNAME: username,
+            CONF_SUBSCRIPTION: subscriptionId,
+            CONF_SUBSCRIPTIONMODEL: "Fleet",
+        }
+        self._data = {
+            RES_UNLIMITED: False,
+            RES_USAGE: None,
+            RES_LIMIT: None,
+            RES_DATA_LEFT: None,
+            RES_PERIOD_START: None,
+            RES_PERIOD_END: None,
+        }
+        self.subscriptionId = subscriptionId
+        self.subscriptionModel = "Fleet"
+        self._password = password
+        self._api = None
+        self.isUpdating = False
+        self.lastRefresh = None
+        self.lastError = None
+        self.uniquePrefix = "tele2.fleet." + username + "." + subscriptionId
+
+    def fetch(self, account: "FleetAccount") -> dict:
+        """Blocking fetch of data usage, run in the executor."""
+        if self._api is None:
+            import pytele2api
+
+            self._api = pytele2api.Tele2Api(
+                self.config[CONF_USERNAME],
+                self._password,
+                subscriptionId=self.subscriptionId,
+            )
+            # One login for the whole account instead of one per line
+            self._api.session = account.session
+        # The api hands back the same dict on every call
+        return dict(self._api.getDataUsage())
+
+    def resetApi(self) -> None:
+        """Drop the client after a failure.
+
+        pytele2api only retries its login once per client until it sees a
+        successful response, so a fresh client is needed to log in again.
+        """
+        self._api = None
+
+
+class FleetAccount:
+    """A shard: all lines sharing one login, refreshed by a single worker."""
+
+    def __init__(self, username: str, lines: list[FleetLine]):
+        self.username = username
+        self.lines = lines
+        self.failures = 0
+        self.skipCycles = 0
+        self._session = None
+
+    @property
+    def session(self):
+        """requests session shared by the lines of this account.
+
+        Only used from the worker handling the account, which fetches one
+        line at a time.
+        """
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+            # pytele2api never passes a timeout, a hung request would block
+            # the worker for good
+            self._session.request = functools.partial(
+                self._session.request, timeout=REQUEST_TIMEOUT
+            )
+        return self._session
+
+    def reset(self) -> None:
+        """Start over with a new session and clients.
+
+        Used after a timed out fetch, whose thread may still be using the
+        old session.
+        """
+        self._session = None
+        for line in self.lines:
+            line.resetApi()
+
+
+class FleetCycleStats:
+    """Progress and latency for one refresh cycle."""
+
+    def __init__(self, cycle: int, total: int):
+        self.cycle = cycle
+        self.total = total
+        self.refreshed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.latencies = []
+        self.started = time.perf_counter()
+        self.duration = None
+
+    @property
+    def done(self) -> int:
+        return self.refreshed + self.failed + self.skipped
+
+    def percentile(self, fraction: float):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+    def asDict(self) -> dict:
+        return {
+            "cycle": self.cycle,
+            "lines": self.total,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "p50_seconds": self.percentile(0.5),
+            "p95_seconds": self.percentile(0.95),
+            "max_seconds": self.percentile(1.0),
+            "duration_seconds": self.duration,
+        }
+
+
+class FleetManager:
+    """Refreshes every line of a fleet once per poll interval.
+
+    Accounts are handed out to at most `workers` concurrent workers, each
+    working through the lines of one account at a time. State writes are
+    held back until the whole cycle is done and then flushed together.
+    """
+
+    def __init__(self, hass: HomeAssistant, config, profile=None):
+        self._hass = hass
+        self._profile = profile
+        self.config = config
+        self.name = config.get(CONF_NAME, "Tele2")
+        self.pollInterval = config.get(POLL_INTERVAL, 1800)
+        self.workers = config.get(FLEET_WORKERS, 8)
+        self.accounts = []
+        for account in config[CONF_FLEET]:
+            username = account[CONF_USERNAME]
+            lines = [
+                FleetLine(self.name, username, account[CONF_PASSWORD], str(sub))
+                for sub in account[CONF_SUBSCRIPTIONS]
+            ]
+            self.accounts.append(FleetAccount(username, lines))
+
+        self.lines = [line for account in self.accounts for line in account.lines]
+        self.uniqueId = "tele2.fleet." + ",".join(
+            sorted(account.username for account in self.accounts)
+        )
+        self.cycle = 0
+        self.lastStats = None
+        self._listeners = {}
+        self._statusListeners = []
+        self._unsubInterval = None
+        self._refreshTask = None
+
+    @callback
+    def async_add_listener(self, line: FleetLine, updateCallback):
+        """Call `updateCallback` when `line` got new data or started failing."""
+        self._listeners.setdefault(id(line), []).append(updateCallback)
+
+        @callback
+        def removeListener():
+            self._listeners[id(line)].remove(updateCallback)
+
+        return removeListener
+
+    @callback
+    def async_add_status_listener(self, updateCallback):
+        """Call `updateCallback` after every cycle."""
+        self._statusListeners.append(updateCallback)
+
+        @callback
+        def removeListener():
+            self._statusListeners.remove(updateCallback)
+
+        return removeListener
+
+    @callback
+    def async_start(self) -> None:
+        """Start refreshing, the first cycle runs right away."""
+        if self._unsubInterval is not None:
+            return
+        self._unsubInterval = async_track_time_interval(
+            self._hass,
+            self._scheduleRefresh,
+            datetime.timedelta(seconds=self.pollInterval),
+        )
+        self._scheduleRefresh()
+
+    @callback
+    def async_stop(self) -> None:
+        if self._unsubInterval is not None:
+            self._unsubInterval()
+            self._unsubInterval = None
+        if self._refreshTask is not None:
+            self._refreshTask.cancel()
+            self._refreshTask = None
+
+    @callback
+    def _scheduleRefresh(self, now=None) -> None:
+        if self._refreshTask is not None and not self._refreshTask.done():
+            _LOGGER.warning(
+                "Fleet refresh %s still running, skipping this interval", self.cycle
+            )
+            return
+        self._refreshTask = self._hass.async_create_background_task(
+            self.async_refresh(), "tele2_datausage fleet refresh"
+        )
+
+    async def async_refresh(self) -> FleetCycleStats:
+        """Run one refresh cycle over all accounts."""
+        self.cycle += 1
+        stats = FleetCycleStats(self.cycle, len(self.lines))
+        updated = []
+
+        queue = asyncio.Queue()
+        for account in self.accounts:
+            if account.skipCycles > 0:
+                account.skipCycles -= 1
+                stats.skipped += len(account.lines)
+                continue
+            queue.put_nowait(account)
+
+        async def worker():
+            while True:
+                try:
+                    account = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await self._refreshAccount(account, stats, updated)
+                _LOGGER.debug(
+                    "Fleet refresh %s: %s/%s lines done",
+                    stats.cycle,
+                    stats.done,
+                    stats.total,
+                )
+
+        await asyncio.gather(
+            *(worker() for _ in range(min(self.workers, queue.qsize())))
+        )
+
+        stats.duration = time.perf_counter() - stats.started
+        self.lastStats = stats
+        self._flush(updated)
+        if stats.refreshed > 0 and self._profile is not None:
+            self._profile.markFirstState()
+
+        _LOGGER.info(
+            "Fleet refresh %s: %s refreshed, %s failed, %s skipped of %s lines in %.1fs (p50 %s, p95 %s, max %s)",
+            stats.cycle,
+            stats.refreshed,
+            stats.failed,
+            stats.skipped,
+            stats.total,
+            stats.duration,
+            _formatSeconds(stats.percentile(0.5)),
+            _formatSeconds(stats.percentile(0.95)),
+            _formatSeconds(stats.percentile(1.0)),
+        )
+        return stats
+
+    async def _refreshAccount(
+        self, account: FleetAccount, stats: FleetCycleStats, updated: list
+    ) -> None:
+        succeeded = 0
+        for line in account.lines:
+            started = time.perf_counter()
+            line.isUpdating = True
+            try:
+                data = await asyncio.wait_for(
+                    self._hass.async_add_executor_job(line.fetch, account),
+                    FETCH_TIMEOUT,
+                )
+            except asyncio.TimeoutError:
+                data = {RES_ERROR: "Timed out after %s seconds" % FETCH_TIMEOUT}
+                account.reset()
+            except Exception as e:  # pylint: disable=broad-except
+                data = {RES_ERROR: e}
+            finally:
+                line.isUpdating = False
+            stats.latencies.append(time.perf_counter() - started)
+
+            error = data.get(RES_ERROR) if data else "Empty response"
+            if error is not None:
+                if line.lastError is None:
+                    # Written with the rest so it shows up as unavailable
+                    updated.append(line)
+                line.lastError = error
+                line.resetApi()
+                stats.failed += 1
+                _LOGGER.debug(
+                    "Error while updating Tele 2 line %s: %s",
+                    line.config[CONF_SUBSCRIPTION],
+                    str(error),
+                )
+                continue
+
+            line._data = data
+            line.lastError = None
+            line.lastRefresh = datetime.datetime.now()
+            stats.refreshed += 1
+            succeeded += 1
+            updated.append(line)
+
+        if succeeded > 0:
+            account.failures = 0
+            return
+
+        # Nothing worked for this login, give the healthy accounts the workers
+        account.failures += 1
+        account.skipCycles = min(2 ** (account.failures - 1), MAX_BACKOFF_CYCLES)
+        _LOGGER.error(
+            "All %s lines of Tele2 account %s failed, skipping it for %s cycles",
+            len(account.lines),
+            account.username,
+            account.skipCycles,
+        )
+
+    @callback
+    def _flush(self, updated: list) -> None:
+        """Write the states of every updated or newly failing line in one go."""
+        for line in updated:
+            for updateCallback in list(self._listeners.get(id(line), [])):
+                updateCallback()
+        for updateCallback in list(self._statusListeners):
+            updateCallback()
+
+
+def _formatSeconds(seconds) -> str:
+    if seconds is None:
+        return "-"
+    return "%.2fs" % seconds
@@ -0,0 +1,186 @@
+import logging
+import datetime
+
+from homeassistant.core import Config, HomeAssistant
+from homeassistant.const import (
+    CONF_NAME,
+    CONF_USERNAME,
+    CONF_PASSWORD,
+)
+
+from .const import (
+    DOMAIN,
+    POLL_INTERVAL,
+    RES_UNLIMITED,
+    RES_LIMIT,
+    RES_USAGE,
+    RES_DATA_LEFT,
+    RES_PERIOD_START,
+    RES_PERIOD_END,
+    CONF_SUBSCRIPTION,
+    CONF_SUBSCRIPTIONMODEL,
+    DEVICE_NAME,
+    RES_ERROR,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Tele2Manager:
+    """Holds the data"""
+
+    def __init__(self, hass: HomeAssistant, config: Config, profile=None):
+        self._hass = hass
+        self._profile = profile
+        self.pollDecreaseFactor = 4
+
+        _LOGGER.debug("Init with config: ", str(config))
+
+        if DOMAIN in hass.data:
+            self._data = hass.data[DOMAIN]
+            _LOGGER.debug("Setting up with stored data: %s", self._data)
+        else:
+            self._data = {
+                RES_UNLIMITED: False,
+                RES_USAGE: None,
+                RES_LIMIT: None,
+                RES_DATA_LEFT: None,
+                RES_PERIOD_START: None,
+                RES_PERIOD_END: None,
+            }
+            _LOGGER.debug("Setting up with new empty data")
+
+        self.config = config
+
+        if CONF_NAME in config:
+            name = config[CONF_NAME]
+        if POLL_INTERVAL in config:
+            pollInterval = config.get(POLL_INTERVAL)
+        if CONF_USERNAME in config:
+            username = config.get(CONF_USERNAME)
+        if CONF_PASSWORD in config:
+            password = config.get(CONF_PASSWORD)
+
+        _LOGGER.debug(
+            "Initing Tele2Session with: %s, %s, %s, %s",
+            name,
+            str(pollInterval),
+            username,
+            "****",
+        )
+
+        # An empty id makes pytele2api build a broken url, it only looks the
+        # subscription up when given None
+        subscriptionId = config.get(CONF_SUBSCRIPTION) or None
+        if subscriptionId is not None:
+            subscriptionId = str(subscriptionId)
+
+        self._api = None
+        self._password = password
+        self.subscriptionId = subscriptionId
+        self.subscriptionModel = config.get(CONF_SUBSCRIPTIONMODEL, DEVICE_NAME)
+        self.pollInterval = pollInterval
+        self.username = username
+        self.isUpdating = False
+        self.isDecreasing = False
+        self.lastPoll = datetime.datetime.now() - datetime.timedelta(30)
+        self.oldDataLeft = 50000
+
+    @property
+    def api(self):
+        """Tele2Api client, created on first use.
+
+        Importing pytele2api and creating the client (which looks up the
+        subscription when none is given) both block, so only touch this
+        from the executor.
+        """
+        if self._api is None:
+            import pytele2api
+
+            self._api = pytele2api.Tele2Api(
+                self.username, self._password, subscriptionId=self.subscriptionId
+            )
+        return self._api
+
+    def resolveSubscription(self) -> None:
+        """Look up the account's subscription when the config has none.
+
+        Blocking, run in the executor.
+        """
+        if self.subscriptionId is not None:
+            return
+        import pytele2api
+
+        # A non-None id keeps the client from doing its own lookup
+        lookup = pytele2api.Tele2Api(self.username, self._password, subscriptionId="")
+        subscription = lookup.getSubscription()
+        if CONF_SUBSCRIPTION not in subscription:
+            raise ValueError("No subscription found for " + self.username)
+        self.subscriptionId = subscription[CONF_SUBSCRIPTION]
+        self.subscriptionModel = subscription[CONF_SUBSCRIPTIONMODEL]
+
+    def getSubscription(self) -> dict:
+        return self.api.getSubscription()
+
+    def getDataUsage(self) -> dict:
+        return self.api.getDataUsage()
+
+    def updateFromApi(self):
+        if self.isUpdating:
+            return
+
+        self.isUpdating = True
+        deltaSeconds = (datetime.datetime.now() - self.lastPoll).total_seconds()
+        shouldPoll = round(deltaSeconds) >= self.pollInterval
+        if self.isDecreasing:
+            shouldPoll = round(deltaSeconds) >= round(
+                self.pollInterval / self.pollDecreaseFactor
+            )
+
+        if not shouldPoll:
+            _LOGGER.debug(
+                "Will wait until more time passed (seconds since last: %s, poll interval: %s)",
+                round(deltaSeconds),
+                round(self.pollInterval / self.pollDecreaseFactor)
+                if self.isDecreasing
+                else self.pollInterval,
+            )
+            self.isUpdating = False
+            return
+
+        _LOGGER.debug("Updating values from API")
+        self._data = self.getDataUsage()
+        self._hass.data[DOMAIN] = self._data
+        if not self._data or self._data.get(RES_ERROR) is not None:
+            _LOGGER.error(
+                "Error while updating Tele 2 data: %s",
+                str(self._data.get(RES_ERROR, "Empty response")),
+            )
+            self.lastPoll = datetime.datetime.now()
+            self.tries = 0
+            self.isUpdating = False
+            return
+
+        self.isDecreasing = False
+        if RES_DATA_LEFT in self._data and self._data[RES_DATA_LEFT] is not None:
+            self.isDecreasing = self._data[RES_DATA_LEFT] < self.oldDataLeft
+            _LOGGER.debug(
+                "newdata: %f, olddata: %f. isdecreasing: %s",
+                self._data[RES_DATA_LEFT],
+                self.oldDataLeft,
+                str(self.isDecreasing),
+            )
+
+        _LOGGER.debug("Updated data: %s", str(self._data))
+        if RES_DATA_LEFT in self._data:
+            self.oldDataLeft = self._data[RES_DATA_LEFT]
+
+        self.lastPoll = datetime.datetime.now()
+        self.tries = 0
+        self.isUpdating = False
+        if self._profile is not None:
+            self._profile.markFirstState()
+        _LOGGER.debug("Update complete")
+
+    async def _update(self):
+        await self._hass.async_add_executor_job(self.updateFromApi)
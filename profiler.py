@@ -0,0 +1,37 @@
+"""Startup timings for the Tele2 integration."""
+import logging
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+_IMPORT_DURATIONS: dict[str, float] = {}
+
+
+def recordImport(module: str, started: float) -> None:
+    """Store how long the body of a module took to import."""
+    _IMPORT_DURATIONS[module] = time.perf_counter() - started
+
+
+class StartupProfile:
+    """Timings for a single setup, from async_setup_entry to first state."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.setupDuration = None
+        self.firstStateDuration = None
+
+    def markSetupDone(self) -> None:
+        if self.setupDuration is None:
+            self.setupDuration = time.perf_counter() - self.started
+
+    def markFirstState(self) -> None:
+        if self.firstStateDuration is None:
+            self.firstStateDuration = time.perf_counter() - self.started
+            _LOGGER.debug("Startup profile: %s", self.asDict())
+
+    def asDict(self) -> dict:
+        return {
+            "import_seconds": dict(_IMPORT_DURATIONS),
+            "setup_seconds": self.setupDuration,
+            "first_state_seconds": self.firstStateDuration,
+        }
@@ -1,6 +1,9 @@
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+import asyncio
 import voluptuous as vol
-import requests
-import json
 import logging
 import datetime
 
@@ -19,41 +22,61 @@ from homeassistant.const import (
     CONF_PASSWORD,
 )
 
-from pytele2api.const import (
+from .const import (
+    DOMAIN,
+    POLL_INTERVAL,
+    DEVICE_NAME,
+    STARTUP_PROFILE,
+    SensorType,
     RES_DATA_LEFT,
     RES_UNLIMITED,
     RES_LIMIT,
     RES_PERIOD_START,
     RES_PERIOD_END,
     CONF_SUBSCRIPTION,
-    CONF_SUBSCRIPTIONMODEL,
     RES_USAGE,
-    RES_ERROR,
-)
-
-from .const import (
-    DOMAIN,
-    POLL_INTERVAL,
-    DEVICE_NAME,
-    SensorType,
+    CONF_FLEET,
+    CONF_SUBSCRIPTIONS,
+    FLEET_WORKERS,
 )
-from . import Tele2Manager
+from .fleet import FleetManager, FleetLine
+from .manager import Tele2Manager
+from .profiler import StartupProfile, recordImport
 
 from homeassistant.const import UnitOfInformation
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 import homeassistant.helpers.config_validation as cv
 
 _LOGGER = logging.getLogger(__name__)
 
+# Wait before retrying a failed subscription lookup, doubled up to the max
+RESOLVE_RETRY_SECONDS = 30
+RESOLVE_RETRY_MAX_SECONDS = 1800
+
+
+FLEET_ACCOUNT_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_USERNAME): cv.string,
+        vol.Required(CONF_PASSWORD): cv.string,
+        vol.Required(CONF_SUBSCRIPTIONS): vol.All(cv.ensure_list, [cv.string]),
+    }
+)
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
     {
         vol.Optional(CONF_NAME, default="Tele2 Data"): cv.string,
-        vol.Optional(POLL_INTERVAL, default=1800): cv.positive_int,
+        vol.Optional(POLL_INTERVAL, default=1800): vol.All(
+            vol.Coerce(int), vol.Range(min=1)
+        ),
         vol.Required(CONF_USERNAME, default=""): cv.string,
         vol.Required(CONF_PASSWORD, default=""): cv.string,
+        vol.Optional(CONF_SUBSCRIPTION): cv.string,
+        vol.Optional(CONF_FLEET): vol.All(cv.ensure_list, [FLEET_ACCOUNT_SCHEMA]),
+        vol.Optional(FLEET_WORKERS, default=8): vol.All(
+            vol.Coerce(int), vol.Range(min=1)
+        ),
     }
 )
 
@@ -62,17 +85,84 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
     """Setup sensor platform for the ui"""
     config = config_entry.data
     _LOGGER.debug("Add entities in async_setup_entry")
-    await _dry_setup(hass, config, async_add_entities)
+    profile = hass.data.get(STARTUP_PROFILE, {}).get(config_entry.entry_id)
+    await _dry_setup(
+        hass, config, async_add_entities, profile=profile, entry=config_entry
+    )
+    if profile is not None:
+        profile.markSetupDone()
     return True
 
 
-async def _dry_setup(hass, config, add_entities, discovery_info=None):
-    """Setup the damn platform using yaml."""
+async def async_setup_platform(
+    hass: HomeAssistant,
+    config: ConfigType,
+    add_entities: AddEntitiesCallback,
+    discovery_info: DiscoveryInfoType | None = None,
+) -> None:
+    """Set up the sensor platform."""
+    _LOGGER.debug("Add entities in async_setup_platform")
+    # Only logged, there is no config entry to attach diagnostics to
+    profile = StartupProfile()
+    await _dry_setup(hass, config, add_entities, profile=profile)
+    profile.markSetupDone()
+    return True
+
+
+async def _dry_setup(hass, config, add_entities, profile=None, entry=None):
+    """Shared setup for yaml and config entries.
+
+    Nothing here waits for Tele2, the first fetch runs in a background task
+    which HA does not wait for during startup.
+    """
     _LOGGER.debug("In dry_setup")
+    if CONF_FLEET in config:
+        _fleet_setup(hass, config, add_entities, profile)
+        return
+
     _LOGGER.debug("Config: %s", config)
-    api = Tele2Manager(hass, config)
-    await api._update()
+    api = Tele2Manager(hass, config, profile)
+    if api.subscriptionId is None:
+        _create_background_task(
+            hass, entry, _async_resolve_and_add(hass, api, add_entities, entry)
+        )
+        return
 
+    _add_entities(hass, api, add_entities, entry)
+
+
+def _create_background_task(hass, entry, target):
+    """Run `target` without holding up startup, cancelled on unload or stop."""
+    name = "tele2_datausage " + target.__name__
+    if entry is not None:
+        return entry.async_create_background_task(hass, target, name)
+    return hass.async_create_background_task(target, name)
+
+
+async def _async_resolve_and_add(hass, api: Tele2Manager, add_entities, entry):
+    """Look up the subscription of a yaml setup without one, then add sensors.
+
+    The subscription id is part of the unique ids, so the sensors can not be
+    added before it is known. Retries until the lookup works.
+    """
+    delay = RESOLVE_RETRY_SECONDS
+    while True:
+        try:
+            await hass.async_add_executor_job(api.resolveSubscription)
+            break
+        except Exception as e:  # pylint: disable=broad-except
+            _LOGGER.warning(
+                "Could not look up the Tele2 subscription for %s, retrying in %s seconds: %s",
+                api.username,
+                delay,
+                e,
+            )
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, RESOLVE_RETRY_MAX_SECONDS)
+    _add_entities(hass, api, add_entities, entry)
+
+
+def _add_entities(hass, api: Tele2Manager, add_entities, entry=None):
     dataLeftSensor = Tele2Sensor(
         hass, api, SensorType.DATA, "Tele2 Data Left", "tele2.dataleft", RES_DATA_LEFT
     )
@@ -102,74 +192,99 @@ async def _dry_setup(hass, config, add_entities, discovery_info=None):
         hass, api, "Tele2 Unlimited Data", "tele2.unlimiteddata", RES_UNLIMITED
     )
 
-    add_entities(
-        [
-            dataLeftSensor,
-            usageSensor,
-            dataTotal,
-            dataPeriodStart,
-            dataPeriodEnd,
-            unlimitedSensor,
-        ]
-    )
-
-    if DOMAIN in hass.data:
-        _LOGGER.debug("data from hass: %s", hass.data[DOMAIN])
+    entities = [
+        dataLeftSensor,
+        usageSensor,
+        dataTotal,
+        dataPeriodStart,
+        dataPeriodEnd,
+        unlimitedSensor,
+    ]
+    add_entities(entities)
+    _create_background_task(hass, entry, _async_first_update(api, entities))
 
 
-async def async_setup_platform(
-    hass: HomeAssistant,
-    config: ConfigType,
-    add_entities: AddEntitiesCallback,
-    discovery_info: DiscoveryInfoType | None = None,
-) -> None:
-    """Set up the sensor platform."""
-
-    _LOGGER.debug("Add entities in async_setup_platform")
-    api = Tele2Manager(hass, config)
+async def _async_first_update(api: Tele2Manager, entities):
+    """Fetch the first data off the startup path and push it to the sensors."""
     await api._update()
-    dataLeftSensor = Tele2Sensor(
-        hass, api, SensorType.DATA, "Tele2 Data Left", "tele2.dataleft", RES_DATA_LEFT
-    )
-    usageSensor = Tele2Sensor(
-        hass, api, SensorType.DATA, "Tele2 Data Used", "tele2.datausage", RES_USAGE
-    )
-    dataTotal = Tele2Sensor(
-        hass, api, SensorType.DATA, "Tele2 Data Total", "tele2.datatotal", RES_LIMIT
+    for entity in entities:
+        # Sensors not added yet pick the data up on their first poll
+        if entity.hass is not None:
+            entity.async_schedule_update_ha_state(True)
+
+
+def _fleet_setup(hass, config, add_entities, profile=None):
+    """Add sensors for every line of a fleet, refreshed by a FleetManager."""
+    fleet = FleetManager(hass, config, profile)
+    _LOGGER.debug(
+        "Setting up fleet %s with %s lines in %s accounts",
+        fleet.name,
+        len(fleet.lines),
+        len(fleet.accounts),
     )
 
-    dataPeriodStart = Tele2Sensor(
-        hass,
-        api,
-        SensorType.DATE,
-        "Tele2 Data Period Start",
-        "tele2.dataperiodstart",
-        RES_PERIOD_START,
-    )
-    dataPeriodEnd = Tele2Sensor(
-        hass,
-        api,
-        SensorType.DATE,
-        "Tele2 Data Period End",
-        "tele2.dataperiodend",
-        RES_PERIOD_END,
-    )
+    entities = []
+    for line in fleet.lines:
+        lineName = line.config[CONF_NAME]
+        entities += [
+            Tele2FleetSensor(
+                hass,
+                fleet,
+                line,
+                SensorType.DATA,
+                lineName + " Data Left",
+                "tele2.dataleft",
+                RES_DATA_LEFT,
+            ),
+            Tele2FleetSensor(
+                hass,
+                fleet,
+                line,
+                SensorType.DATA,
+                lineName + " Data Used",
+                "tele2.datausage",
+                RES_USAGE,
+            ),
+            Tele2FleetSensor(
+                hass,
+                fleet,
+                line,
+                SensorType.DATA,
+                lineName + " Data Total",
+                "tele2.datatotal",
+                RES_LIMIT,
+            ),
+            Tele2FleetSensor(
+                hass,
+                fleet,
+                line,
+                SensorType.DATE,
+                lineName + " Data Period Start",
+                "tele2.dataperiodstart",
+                RES_PERIOD_START,
+            ),
+            Tele2FleetSensor(
+                hass,
+                fleet,
+                line,
+                SensorType.DATE,
+                lineName + " Data Period End",
+                "tele2.dataperiodend",
+                RES_PERIOD_END,
+            ),
+            Tele2FleetBinaryDataSensor(
+                hass,
+                fleet,
+                line,
+                lineName + " Unlimited Data",
+                "tele2.unlimiteddata",
+                RES_UNLIMITED,
+            ),
+        ]
 
-    unlimitedSensor = Tele2BinaryDataSensor(
-        hass, api, "Tele2 Unlimited Data", "tele2.unlimiteddata", RES_UNLIMITED
-    )
-    add_entities(
-        [
-            dataLeftSensor,
-            usageSensor,
-            dataTotal,
-            dataPeriodStart,
-            dataPeriodEnd,
-            unlimitedSensor,
-        ],
-        True,
-    )
-    return True
+    # Added last, it starts the refresh once the line sensors are listening
+    entities.append(Tele2FleetStatusSensor(fleet))
+    add_entities(entities)
 
 
 class Tele2Sensor(SensorEntity):
@@ -220,7 +335,7 @@ class Tele2Sensor(SensorEntity):
     @property
     def unique_id(self) -> str:
         """Return a unique, Home Assistant friendly identifier for this entity."""
-        return self._identifier + "." + self._tele2Session.config[CONF_SUBSCRIPTION]
+        return self._identifier + "." + self._tele2Session.subscriptionId
 
     """ @property
     def extra_state_attributes(self):
@@ -229,10 +344,10 @@ class Tele2Sensor(SensorEntity):
     @property
     def device_info(self):
         return {
-            "identifiers": {(DOMAIN, self._tele2Session.config[CONF_SUBSCRIPTION])},
+            "identifiers": {(DOMAIN, self._tele2Session.subscriptionId)},
             "name": self._tele2Session.config[CONF_NAME],
             "manufacturer": DEVICE_NAME,
-            "model": self._tele2Session.config[CONF_SUBSCRIPTIONMODEL],
+            "model": self._tele2Session.subscriptionModel,
         }
 
     async def async_will_remove_from_hass(self):
@@ -242,7 +357,7 @@ class Tele2Sensor(SensorEntity):
         """Manual updates of the sensor."""
         if not self._tele2Session.isUpdating:
             await self._tele2Session._update()
-        newValue = self._tele2Session._data[self._updateField]
+        newValue = self._tele2Session._data.get(self._updateField)
         if newValue != self._attr_native_value and newValue is not None:
             self._attr_native_value = newValue
 
@@ -251,7 +366,12 @@ class Tele2BinaryDataSensor(BinarySensorEntity):
     """Representation of a Sensor."""
 
     def __init__(
-        self, hass, tele2Session: Tele2Manager, sensorName, identifier, updateField
+        self,
+        hass,
+        tele2Session: Tele2Manager,
+        sensorName,
+        identifier,
+        updateField,
     ) -> None:
         super().__init__()
         self._hass = hass
@@ -274,15 +394,15 @@ class Tele2BinaryDataSensor(BinarySensorEntity):
     @property
     def unique_id(self) -> str:
         """Return a unique, Home Assistant friendly identifier for this entity."""
-        return self._identifier + "." + self._tele2Session.config[CONF_SUBSCRIPTION]
+        return self._identifier + "." + self._tele2Session.subscriptionId
 
     @property
     def device_info(self):
         return {
-            "identifiers": {(DOMAIN, self._tele2Session.config[CONF_SUBSCRIPTION])},
+            "identifiers": {(DOMAIN, self._tele2Session.subscriptionId)},
             "name": self._tele2Session.config[CONF_NAME],
             "manufacturer": DEVICE_NAME,
-            "model": self._tele2Session.config[CONF_SUBSCRIPTIONMODEL],
+            "model": self._tele2Session.subscriptionModel,
         }
 
     @property
@@ -304,6 +424,148 @@ class Tele2BinaryDataSensor(BinarySensorEntity):
         _LOGGER.debug(
             "Will update unlimited binary sensor data (async) from previous call"
         )
-        newValue = self._tele2Session._data[self._updateField]
+        newValue = self._tele2Session._data.get(self._updateField)
         if newValue != self._attr_is_on and newValue is not None:
             self._attr_is_on = newValue
+
+
+class Tele2FleetSensor(Tele2Sensor):
+    """Sensor for one fleet line, written by the FleetManager."""
+
+    _attr_should_poll = False
+
+    def __init__(
+        self,
+        hass,
+        fleet: FleetManager,
+        line: FleetLine,
+        sensorType: SensorType,
+        sensorName,
+        identifier,
+        updateField,
+    ) -> None:
+        super().__init__(hass, line, sensorType, sensorName, identifier, updateField)
+        self._fleet = fleet
+
+    async def async_added_to_hass(self):
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            self._fleet.async_add_listener(self._tele2Session, self._handleRefresh)
+        )
+
+    @property
+    def unique_id(self) -> str:
+        """Fleet prefixed, so a line that also has its own setup does not clash."""
+        return self._tele2Session.uniquePrefix + "." + self._identifier
+
+    @property
+    def device_info(self):
+        return {
+            "identifiers": {(DOMAIN, self._tele2Session.uniquePrefix)},
+            "name": self._tele2Session.config[CONF_NAME],
+            "manufacturer": DEVICE_NAME,
+            "model": self._tele2Session.subscriptionModel,
+        }
+
+    @property
+    def available(self) -> bool:
+        return self._tele2Session.lastError is None
+
+    @callback
+    def _handleRefresh(self) -> None:
+        newValue = self._tele2Session._data.get(self._updateField)
+        if newValue is not None:
+            self._attr_native_value = newValue
+        self.async_write_ha_state()
+
+    async def async_update(self) -> None:
+        """Values are pushed by the fleet, nothing to fetch here."""
+
+
+class Tele2FleetBinaryDataSensor(Tele2BinaryDataSensor):
+    """Unlimited data sensor for one fleet line, written by the FleetManager."""
+
+    _attr_should_poll = False
+
+    def __init__(
+        self,
+        hass,
+        fleet: FleetManager,
+        line: FleetLine,
+        sensorName,
+        identifier,
+        updateField,
+    ) -> None:
+        super().__init__(hass, line, sensorName, identifier, updateField)
+        self._fleet = fleet
+
+    async def async_added_to_hass(self):
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            self._fleet.async_add_listener(self._tele2Session, self._handleRefresh)
+        )
+
+    @property
+    def unique_id(self) -> str:
+        """Fleet prefixed, so a line that also has its own setup does not clash."""
+        return self._tele2Session.uniquePrefix + "." + self._identifier
+
+    @property
+    def device_info(self):
+        return {
+            "identifiers": {(DOMAIN, self._tele2Session.uniquePrefix)},
+            "name": self._tele2Session.config[CONF_NAME],
+            "manufacturer": DEVICE_NAME,
+            "model": self._tele2Session.subscriptionModel,
+        }
+
+    @property
+    def available(self) -> bool:
+        return self._tele2Session.lastError is None
+
+    @callback
+    def _handleRefresh(self) -> None:
+        newValue = self._tele2Session._data.get(self._updateField)
+        if newValue is not None:
+            self._attr_is_on = newValue
+        self.async_write_ha_state()
+
+    async def async_update(self) -> None:
+        """Values are pushed by the fleet, nothing to fetch here."""
+
+
+class Tele2FleetStatusSensor(SensorEntity):
+    """Number of healthy fleet lines, with stats of the last refresh cycle.
+
+    Owns the fleet refresh: it starts when the sensor is added and stops
+    when it is removed.
+    """
+
+    _attr_should_poll = False
+
+    def __init__(self, fleet: FleetManager) -> None:
+        super().__init__()
+        self._fleet = fleet
+        self._attr_name = fleet.name + " Fleet"
+        self._attr_unique_id = fleet.uniqueId
+        self._attr_state_class = SensorStateClass.MEASUREMENT
+        self._attr_native_value = None
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(self._fleet.async_add_status_listener(self._handleRefresh))
+        self._fleet.async_start()
+
+    async def async_will_remove_from_hass(self):
+        self._fleet.async_stop()
+
+    @callback
+    def _handleRefresh(self) -> None:
+        self._attr_native_value = len(
+            [line for line in self._fleet.lines if line.lastError is None]
+        )
+        if self._fleet.lastStats is not None:
+            self._attr_extra_state_attributes = self._fleet.lastStats.asDict()
+        self.async_write_ha_state()
+
+
+recordImport(__name__, _IMPORT_STARTED)